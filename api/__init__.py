@@ -26,12 +26,21 @@ from api.config import config, ConfigException
 from api import middleware
 from api import data
 from api import repo
+from api import timetable
+from api import occupancy
+from api import changes
 
 
+courses = data.Resource(provider_class=data.Course)
+course_occupancy = occupancy.Occupancy(courses)
+
 dispatch_appmap = {
-    '/courses': data.Resource(provider_class=data.Course),
+    '/courses': courses,
     '/subjects': data.Resource(provider_class=data.Subject),
-    '/instructors': data.Resource(provider_class=data.Instructor),
+    '/instructors': occupancy.InstructorResource(course_occupancy),
+    '/rooms': occupancy.Rooms(course_occupancy),
+    '/changes': changes.Changes([data.Course, data.Subject, data.Instructor]),
+    '/schedules': timetable.Schedules(courses),
 }
 
 
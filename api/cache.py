@@ -0,0 +1,57 @@
+"""
+    api.cache
+    ~~~~~~~~~
+
+    Bounded in-memory caching.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class LRUCache(object):
+    """A thread-safe mapping that forgets its least recently used keys.
+
+    At most `maxsize` items are kept.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value  # move it to the most-recent end
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def keys(self):
+        """Get a snapshot of the keys, from least to most recently used"""
+        with self._lock:
+            return list(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
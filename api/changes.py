@@ -0,0 +1,104 @@
+"""
+    api.changes
+    ~~~~~~~~~~~
+
+    Report which items changed between two commits of the data repo.
+
+
+    Only the files in `git diff` between the commits are looked at. Each
+    changed file is mapped back to the item it belongs to, which is loaded
+    from both commits to get its uid before and after.
+"""
+
+import os
+import logging
+from werkzeug.exceptions import BadRequest
+from werkzeug.routing import Map, Rule
+from api import config
+from api import repo
+from api.data import BaseResource, LOAD_ERRORS
+from api.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def load_id(provider_class, source, fs_thing):
+    """Get one item's uid in a source, or None if it doesn't exist there.
+
+    Items that can't be loaded are treated as missing, like in `?at=` snapshots.
+    """
+    path = os.path.join(config['DATA_LOCAL'], 'data', provider_class.fs_path, fs_thing)
+    try:
+        return provider_class(path, source=source).get_id()
+    except (IOError, OSError):
+        return None
+    except LOAD_ERRORS as e:
+        logger.warning('Skipping {} at {}: {}'.format(path, source.sha, e))
+        return None
+
+
+def diff_items(provider_classes, since, until):
+    """Get {fs_path: {'added': [uid, ...], 'modified': [...], 'removed': [...]}} between two commit shas."""
+    touched = {}  # fs_path: set of fs_things
+    diff = repo.git('diff', '--name-only', '-z', '--no-renames', since, until, '--', 'data')
+    for filename in diff.decode('utf-8').split('\0'):
+        parts = filename.split('/')
+        if len(parts) >= 3:
+            touched.setdefault(parts[1], set()).add(parts[2])
+
+    before, after = repo.Revision(since), repo.Revision(until)
+    changes = {}
+    for provider_class in provider_classes:
+        added, modified, removed = set(), set(), set()
+        for fs_thing in touched.get(provider_class.fs_path, ()):
+            old = load_id(provider_class, before, fs_thing)
+            new = load_id(provider_class, after, fs_thing)
+            if old is not None and old == new:
+                modified.add(new)
+                continue
+            if old is not None:
+                removed.add(old)
+            if new is not None:
+                added.add(new)
+        changes[provider_class.fs_path] = {
+            'added': sorted(added),
+            'modified': sorted(modified),
+            'removed': sorted(removed),
+        }
+    return changes
+
+
+class Changes(BaseResource):
+    """Serve the uids that were added, modified or removed between commits
+
+    GET /?since=<commit>[&until=<commit>]
+
+    `until` defaults to the latest commit. Clients can pass the `until` sha
+    from a response as `since` next time to sync incrementally. Writes show
+    up here once they are committed.
+    """
+
+    def __init__(self, provider_classes):
+        self.url_map = Map([
+            Rule('/', methods=['GET'], endpoint=self.changes_handler),
+        ])
+        self.provider_classes = provider_classes
+        self._diffs = LRUCache(int(config['CHANGES_CACHE_SIZE']))
+
+    def resolve_arg(self, request, name, default=None):
+        rev = request.args.get(name, default)
+        if rev is None:
+            raise BadRequest('{}= is required'.format(name))
+        sha = repo.resolve(rev)
+        if sha is None:
+            raise BadRequest('Couldn\'t find a revision for {}'.format(rev))
+        return sha
+
+    def changes_handler(self, request):
+        since = self.resolve_arg(request, 'since')
+        until = self.resolve_arg(request, 'until', 'HEAD')
+        changes = self._diffs.get((since, until))
+        if changes is None:
+            changes = self._diffs[since, until] = diff_items(self.provider_classes, since, until)
+        return self.render_json({'since': since, 'until': until, 'changes': changes})
@@ -37,6 +37,15 @@ variables = (
     # Variables are a three-tuple of the form (NAME, 'default' or REQUIRED, 'help text')
     ('DATA_REMOTE', 'https://github.com/Queens-Hacks/qcumber-data.git', 'the remote repository to read/write data'),
     ('DATA_LOCAL', 'data', 'the folder used to store the data repository locally'),
+    ('TERM_CACHE_SIZE', '256', 'the number of parsed course terms to keep in memory'),
+    ('RESPONSE_CACHE_SIZE', '4096', 'the number of encoded items to keep in memory for each resource'),
+    ('SNAPSHOT_CACHE_SIZE', '8', 'the number of past revisions of each resource to keep in memory'),
+    ('CHANGES_CACHE_SIZE', '64', 'the number of change sets between pairs of commits to keep in memory'),
+    ('WRITE_TOKEN', None, 'the bearer token clients must send to write data; writes are disabled without one'),
+    ('COMMIT_INTERVAL', '30', 'the number of seconds to collect writes for before committing them'),
+    ('PUSH_REMOTE', 'origin', 'the remote to push data commits to; leave empty to never push'),
+    ('COMMIT_NAME', 'qcumber-api', 'the author name for data commits'),
+    ('COMMIT_EMAIL', 'api@qcumber.ca', 'the author email for data commits'),
 )
 
 
@@ -6,27 +6,133 @@
 """
 
 import os
-import glob
+import re
+import hmac
 import json
 import yaml
+import fnmatch
+import logging
+import itertools
+from threading import Lock
+from collections import OrderedDict
 from werkzeug.wrappers import Request, Response
-from werkzeug.exceptions import NotFound, HTTPException
+from werkzeug.exceptions import BadRequest, Forbidden, NotFound, Unauthorized, HTTPException
 from werkzeug.routing import Map, Rule
 from api import config
+from api import repo
+from api.cache import LRUCache
 
 
-class Resource(object):
+logger = logging.getLogger(__name__)
+
+text_type = type(u'')
+string_types = (type(''), text_type)  # python 2's yaml loads ascii strings as str
+
+# What loading a document that's malformed, or missing fields, can raise
+LOAD_ERRORS = (yaml.YAMLError, KeyError, TypeError, AttributeError)
+
+
+class InvalidData(ValueError):
+    """Raised when data sent to be written doesn't make sense for its provider."""
+
+
+def rename_over(src, dst):
+    """Rename `src` to `dst`, replacing it if it exists (os.replace is python 3 only)."""
+    try:
+        os.rename(src, dst)
+    except OSError:  # windows won't rename onto an existing file
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def write_yaml(path, data):
+    """Replace a YAML file atomically, so readers never see half of it."""
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'w') as f:
+        yaml.safe_dump(data, f, default_flow_style=False, allow_unicode=True)
+    rename_over(temp_path, path)
+
+
+ALL_TERMS = 'all'  # ?term=all asks for every term instead of the default
+
+
+def requested_terms(request):
+    """Get the term keys from ?term= args as a sorted tuple, or None if none were given.
+
+    Terms can be repeated (?term=fall-2013&term=winter-2014) or comma-separated.
+    """
+    keys = set(key.strip().lower() for arg in request.args.getlist('term') for key in arg.split(','))
+    keys.discard('')
+    return tuple(sorted(keys)) or None
+
+
+class BaseResource(object):
+    """Dispatch WSGI requests to handlers through a werkzeug url map.
+
+    Subclasses must set up `self.url_map`, with handler methods as endpoints.
+    """
+
+    def render_json(self, data):
+        return Response(json.dumps(data), mimetype='application/json')
+
+    def render_encoded(self, encoded):
+        return Response(encoded, mimetype='application/json')
+
+    def dispatch_request(self, request):
+        adapter = self.url_map.bind_to_environ(request.environ)
+        try:
+            handler, values = adapter.match()
+            return (handler)(request, **values)
+        except HTTPException as e:
+            return e
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        response = self.dispatch_request(request)
+        return response(environ, start_response)
+
+
+class Resource(BaseResource):
     """Provides url routing for the api
 
     Instances of this class are WSGI apps, routed to by a base URL. They are
     responsible for mapping HTTP requests to DataProviders.
+
+    Many items can be fetched at once with `GET /?ids=A,B,C`, or by POSTing a
+    JSON body like `{"ids": ["A", "B", "C"]}` to the resource root. Batch
+    responses are a list with one entry per requested id, so unknown ids are
+    reported individually instead of failing the whole request.
+
+    Items with terms only include their latest one, unless others are asked
+    for with `?term=fall-2013`, or all of them with `?term=all`. Encodings of
+    every term aren't cached, since they grow with the catalog's history.
+
+    Past data can be read with `?at=<commit>` or `?at=<YYYY-MM-DD>`. It's
+    loaded straight from the data repo's git objects, and the most recently
+    used revisions are kept in memory.
+
+    Existing items can be replaced with PUT or partially updated with PATCH,
+    given a JSON body and an `Authorization: Bearer <WRITE_TOKEN>` header.
+    Changes are served immediately and committed to the data repo in batches
+    by `commit_queue`.
     """
-    def __init__(self, provider_class):
+
+    max_batch_size = 100
+
+    def __init__(self, provider_class, commit_queue=repo.commit_queue):
         self.url_map = Map([
             Rule('/', methods=['GET'], endpoint=self.list_handler),
-            Rule('/<uid>/', methods=['GET'], endpoint=self.item_handler)
+            Rule('/', methods=['POST'], endpoint=self.batch_handler),
+            Rule('/<uid>/', methods=['GET'], endpoint=self.item_handler),
+            Rule('/<uid>/', methods=['PUT'], endpoint=self.put_handler),
+            Rule('/<uid>/', methods=['PATCH'], endpoint=self.patch_handler),
         ])
         self.provider_class = provider_class
+        self.commit_queue = commit_queue
+        self.listeners = []  # called with the uid of each item that changes
+        self._encoded = LRUCache(int(config['RESPONSE_CACHE_SIZE']))
+        self._snapshots = LRUCache(int(config['SNAPSHOT_CACHE_SIZE']))
+        self._write_lock = Lock()
 
     @property
     def data_map(self):
@@ -36,31 +142,134 @@ class Resource(object):
             self._data_map = data_map = self.provider_class.load_all()
         return data_map
 
+    def snapshot(self, sha):
+        """Get the data map as of a commit. Snapshots are never modified."""
+        data_map = self._snapshots.get(sha)
+        if data_map is None:
+            try:
+                # history can't be fixed, so skip its bad items instead of failing
+                data_map = self.provider_class.load_all(repo.Revision(sha), skip_invalid=True)
+            except (IOError, OSError):
+                raise NotFound('There were no {} at {}'.format(self.provider_class.fs_path, sha))
+            self._snapshots[sha] = data_map
+        return data_map
+
+    def requested_revision(self, request):
+        """Resolve the ?at= arg to a commit sha, or None for the current data."""
+        if 'at' not in request.args:
+            return None
+        sha = repo.resolve(request.args['at'])
+        if sha is None:
+            raise BadRequest('Couldn\'t find a revision for {}'.format(request.args['at']))
+        return sha
+
+    def get_data_map(self, at=None):
+        return self.data_map if at is None else self.snapshot(at)
+
+    def encoded_item(self, uid, terms=None, at=None):
+        """Get the JSON-encoded bytes for an item, or None if it doesn't exist.
+
+        Encodings are kept around so that batches and lists can be stitched
+        together without serializing every item again.
+        """
+        item = self.get_data_map(at).get(uid, None)
+        if item is None:
+            return None
+        key = (at, uid, terms)
+        cached = self._encoded.get(key)
+        if cached is not None and cached[0] is item:  # skip encodings of replaced items
+            return cached[1]
+        try:
+            dumped = item.dump(terms)
+        except LOAD_ERRORS as e:
+            if at is None:
+                raise
+            logger.warning('Skipping {} at {}: {}'.format(uid, at, e))
+            return None
+        encoded = json.dumps(dumped).encode('utf-8')
+        if terms is None or ALL_TERMS not in terms:
+            self._encoded[key] = (item, encoded)
+        return encoded
+
     def list_handler(self, request):
-        data_list = list(self.data_map.values())
-        return self.render_json(data_list)
+        terms = requested_terms(request)
+        at = self.requested_revision(request)
+        if 'ids' in request.args:
+            uids = [uid.strip() for uid in request.args['ids'].split(',')]
+            return self.render_batch([uid for uid in uids if uid], terms, at)
+        encoded_items = [self.encoded_item(uid, terms, at) for uid in self.get_data_map(at)]
+        return self.render_encoded(b'[' + b', '.join(e for e in encoded_items if e is not None) + b']')
+
+    def batch_handler(self, request):
+        try:
+            body = json.loads(request.get_data(as_text=True))
+            uids = body['ids']
+        except (ValueError, TypeError, KeyError):
+            raise BadRequest('Expected a JSON body like {"ids": ["uid", ...]}')
+        if not isinstance(uids, list) or not all(isinstance(uid, text_type) for uid in uids):
+            raise BadRequest('"ids" must be a list of strings')
+        return self.render_batch(uids, requested_terms(request), self.requested_revision(request))
 
     def item_handler(self, request, uid):
-        item = self.data_map.get(uid, None)
-        if item is None:
+        encoded = self.encoded_item(uid, requested_terms(request), self.requested_revision(request))
+        if encoded is None:
             raise NotFound()
-        return self.render_json(item)
+        return self.render_encoded(encoded)
 
-    def render_json(self, data):
-        return Response(json.dumps(data), mimetype='application/json')
+    def put_handler(self, request, uid):
+        return self.write(request, uid, lambda item, body: body)
 
-    def dispatch_request(self, request):
-        adapter = self.url_map.bind_to_environ(request.environ)
+    def patch_handler(self, request, uid):
+        return self.write(request, uid, lambda item, body: dict(item, **body))
+
+    def write(self, request, uid, merge):
+        """Validate and save new data for an item, then queue it to be committed."""
+        self.check_write_access(request)
         try:
-            handler, values = adapter.match()
-            return (handler)(request, **values)
-        except HTTPException as e:
-            return e
+            body = json.loads(request.get_data(as_text=True))
+        except ValueError:
+            raise BadRequest('Expected a JSON body')
+        if not isinstance(body, dict):
+            raise BadRequest('Expected a JSON object')
 
-    def __call__(self, environ, start_response):
-        request = Request(environ)
-        response = self.dispatch_request(request)
-        return response(environ, start_response)
+        with self._write_lock:
+            item = self.data_map.get(uid, None)
+            if item is None:
+                raise NotFound()
+            try:
+                updated = self.provider_class(item.path, data=merge(item, body))
+                if updated.get_id() != uid:
+                    raise InvalidData('Items can\'t be renamed (id would become {})'.format(updated.get_id()))
+            except InvalidData as e:
+                raise BadRequest(str(e))
+            paths = updated.save()
+            self.data_map[uid] = updated
+
+        for listener in self.listeners:
+            listener(uid)
+        self.commit_queue.add(paths, 'Update {} {}'.format(self.provider_class.__name__.lower(), uid))
+        return self.render_encoded(self.encoded_item(uid, requested_terms(request)))
+
+    def check_write_access(self, request):
+        token = config['WRITE_TOKEN']
+        if not token:
+            raise Forbidden('Writes are disabled for this api')
+        auth = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth.encode('utf-8'), 'Bearer {}'.format(token).encode('utf-8')):
+            raise Unauthorized()
+
+    def render_batch(self, uids, terms=None, at=None):
+        if len(uids) > self.max_batch_size:
+            raise BadRequest('Batches are limited to {} ids'.format(self.max_batch_size))
+        entries = []
+        for uid in uids:
+            encoded_uid = json.dumps(uid).encode('utf-8')
+            encoded = self.encoded_item(uid, terms, at)
+            if encoded is None:
+                entries.append(b'{"uid": ' + encoded_uid + b', "status": 404, "item": null}')
+            else:
+                entries.append(b'{"uid": ' + encoded_uid + b', "status": 200, "item": ' + encoded + b'}')
+        return self.render_encoded(b'[' + b', '.join(entries) + b']')
 
 
 class DataProvider(dict):
@@ -68,38 +277,204 @@ class DataProvider(dict):
 
     Objects of this type are responsible for mapping data to the filesystem.
     One instance is created for each item in `os.listdir` of its `fs_path`.
+    Files are read through `source`, either the working tree or a past
+    `repo.Revision`.
+
+    Passing `data` creates an item with new content for `path` instead of
+    loading it, ready to be `save`d.
     """
 
     fs_path = None  # subclasses must override this
+    required_fields = ()  # string fields that must be present to save
 
-    def __init__(self, path):
+    def __init__(self, path, data=None, source=repo.working_tree):
         self.path = path
-        self.load()
+        self.source = source
+        if data is None:
+            self.load()
+        else:
+            self.receive(data)
+
+    def receive(self, data):
+        """Validate and take on new data, raising InvalidData if it's no good."""
+        for field in self.required_fields:
+            if not isinstance(data.get(field), string_types):
+                raise InvalidData('"{}" is required, and must be a string'.format(field))
+        self.update(data)
+
+    def save(self):
+        """Write this item to the filesystem, returning the paths written."""
+        write_yaml(self.path, dict(self))
+        return [self.path]
+
+    def dump(self, terms=None):
+        """Get the data to serialize for this item.
+
+        `terms` picks the terms included, for providers that have them.
+        """
+        return self
+
+    def source_paths(self):
+        """List the files this item is loaded from."""
+        return [self.path]
+
+    def load_yaml(self, path):
+        with self.source.open(path) as f:
+            return yaml.safe_load(f)
 
     @classmethod
-    def load_all(cls):
+    def load_all(cls, source=repo.working_tree, skip_invalid=False):
+        """Load every item from `source` by id.
+
+        With `skip_invalid`, items that fail to load are logged and left out.
+        """
         rel_root = os.path.join(config['DATA_LOCAL'], 'data', cls.fs_path)
-        fs_things = os.listdir(rel_root)
+        fs_things = source.listdir(rel_root)
         loaded = {}
         for fs_thing in fs_things:
-            provider = cls(os.path.join(rel_root, fs_thing))
-            provider_id = provider.get_id()
+            path = os.path.join(rel_root, fs_thing)
+            try:
+                provider = cls(path, source=source)
+                provider_id = provider.get_id()
+            except LOAD_ERRORS as e:
+                if not skip_invalid:
+                    raise
+                logger.warning('Skipping {}: {}'.format(path, e))
+                continue
             loaded[provider_id] = provider
         return loaded
 
 
+SEASONS = ('winter', 'summer', 'fall')  # in calendar order
+
+TERM_FILENAME = re.compile(r'^term-(?P<key>(?P<season>[a-z]+)-(?P<year>\d+))\.yml$')
+
+# Parsed term documents, shared by all courses, keyed by
+# (source, course path, term key, manifest version)
+term_cache = LRUCache(int(config['TERM_CACHE_SIZE']))
+
+# Each term manifest gets a new version, so that a reader still holding a
+# replaced course can't put its terms in the cache for the course's new data
+manifest_versions = itertools.count()
+
+
+def term_key(term):
+    """Identify a term document like `fall-2013`"""
+    return '{}-{}'.format(term['season'], term['year']).lower()
+
+
+def term_sort_key(key):
+    """Order term keys like `fall-2013` chronologically"""
+    season, year = key.rsplit('-', 1)
+    season_index = SEASONS.index(season) if season in SEASONS else len(SEASONS)
+    return int(year), season_index
+
+
+def check_term(key, term):
+    """Raise InvalidData unless every section and timeslot of a term can be read."""
+    from api.timetable import compile_term  # timetable builds on this module
+    sections = term.get('sections') or []
+    if not isinstance(sections, list) or not all(isinstance(s, dict) for s in sections):
+        raise InvalidData('"sections" of {} must be a list of objects'.format(key))
+    for section in sections:
+        timeslots = section.get('timeslots') or []
+        if not isinstance(timeslots, list):
+            raise InvalidData('"timeslots" of {} must be a list'.format(key))
+        for timeslot in timeslots:
+            if not isinstance(timeslot, dict) or not isinstance(timeslot.get('day_of_week'), int):
+                raise InvalidData('Timeslots of {} need an integer "day_of_week"'.format(key))
+            if not all(isinstance(ref, string_types) for ref in timeslot.get('instructors') or []):
+                raise InvalidData('Instructors of {} must be strings'.format(key))
+    try:
+        compile_term(None, term)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise InvalidData('Timeslots of {} need "start_time" and "end_time" like HH:MM, '
+                          'and must not end before they start'.format(key))
+
+
 class Course(DataProvider):
+    """A course, with terms loaded lazily from term-<season>-<year>.yml files.
+
+    Only the term manifest, {term key: filename} in chronological order, is
+    built up front. Term documents are parsed on first access and kept in the
+    bounded `term_cache`.
+
+    New data can include `terms`, a list of term documents. Each replaces the
+    term with the same season and year, and other terms are left alone. Terms
+    are checked by compiling them like `/schedules` does, so that anything
+    saved can be read back by every endpoint.
+    """
+
     fs_path = 'courses'
+    required_fields = ('title', 'subject', 'number')
 
     def load(self):
         course_filename = os.path.join(self.path, 'course.yml')
-        term_filenames = glob.glob(os.path.join(self.path, 'term-*.yml'))
-        course = yaml.load(open(course_filename))
-        course['terms'] = []
-        for term_filename in term_filenames:
-            term = yaml.load(open(term_filename))
-            course['terms'].append(term)
+        course = self.load_yaml(course_filename)
         self.update(course)
+        self.load_term_manifest()
+
+    def receive(self, data):
+        data = dict(data)
+        terms = data.pop('terms', None) or []
+        if not isinstance(terms, list):
+            raise InvalidData('"terms" must be a list')
+        for term in terms:
+            try:
+                key = term_key(term)
+            except (TypeError, KeyError):
+                raise InvalidData('Terms need a season and a year')
+            if not TERM_FILENAME.match('term-{}.yml'.format(key)):
+                raise InvalidData('Unrecognized term {}'.format(key))
+            check_term(key, term)
+        self.new_terms = terms
+        super(Course, self).receive(data)
+
+    def save(self):
+        course_filename = os.path.join(self.path, 'course.yml')
+        write_yaml(course_filename, dict(self))
+        paths = [course_filename]
+        for term in self.new_terms:
+            key = term_key(term)
+            term_filename = os.path.join(self.path, 'term-{}.yml'.format(key))
+            write_yaml(term_filename, term)
+            paths.append(term_filename)
+        self.load_term_manifest()
+        return paths
+
+    def load_term_manifest(self):
+        term_filenames = fnmatch.filter(self.source.listdir(self.path), 'term-*.yml')
+        found = []
+        for term_filename in (os.path.join(self.path, f) for f in term_filenames):
+            match = TERM_FILENAME.match(os.path.basename(term_filename).lower())
+            if match:
+                found.append((term_sort_key(match.group('key')), match.group('key'), term_filename))
+        self.term_manifest = OrderedDict((key, filename) for _, key, filename in sorted(found))
+        self.manifest_version = next(manifest_versions)
+
+    def get_terms(self, keys=None):
+        """Get the parsed term documents for `keys`, or for every term by default."""
+        terms = []
+        for key, term_filename in self.term_manifest.items():
+            if keys is not None and key not in keys:
+                continue
+            cache_key = (self.source.cache_key, self.path, key, self.manifest_version)
+            term = term_cache.get(cache_key)
+            if term is None:
+                term = term_cache[cache_key] = self.load_yaml(term_filename)
+            terms.append(term)
+        return terms
+
+    def dump(self, terms=None):
+        """Include the latest term, or the ones in `terms`, or every one for ALL_TERMS"""
+        if terms is None:
+            terms = list(self.term_manifest)[-1:]
+        elif ALL_TERMS in terms:
+            terms = None
+        return dict(self, terms=self.get_terms(terms))
+
+    def source_paths(self):
+        return [os.path.join(self.path, 'course.yml')] + list(self.term_manifest.values())
 
     def get_id(self):
         # UGLY HACK (should dereference the subject)
@@ -108,9 +483,10 @@ class Course(DataProvider):
 
 class Subject(DataProvider):
     fs_path = 'subjects'
+    required_fields = ('code',)
 
     def load(self):
-        data = yaml.load(open(self.path))
+        data = self.load_yaml(self.path)
         self.update(data)
 
     def get_id(self):
@@ -119,9 +495,10 @@ class Subject(DataProvider):
 
 class Instructor(DataProvider):
     fs_path = 'instructors'
+    required_fields = ('name',)
 
     def load(self):
-        data = yaml.load(open(self.path))
+        data = self.load_yaml(self.path)
         self.update(data)
 
     def get_id(self):
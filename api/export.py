@@ -0,0 +1,150 @@
+"""
+    api.export
+    ~~~~~~~~~~
+
+    Pre-render the data endpoints to static files, for serving without the app.
+
+
+    Each endpoint's body goes to `<url>/index.json`, next to a gzipped copy
+    at `index.json.gz` (for nginx's gzip_static). `manifest.json` records a
+    fingerprint of the source files behind every endpoint, so later exports
+    only render endpoints whose source YAML has changed.
+"""
+
+import os
+import gzip
+import errno
+import json
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+from werkzeug.test import create_environ, run_wsgi_app
+from api import data
+
+
+MANIFEST = 'manifest.json'
+
+logger = logging.getLogger(__name__)
+
+
+class ExportError(Exception):
+    """Raised when an endpoint doesn't render successfully."""
+
+
+def fingerprint(parts):
+    """Hash a list of json-serializable things"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def source_fingerprint(paths):
+    """Fingerprint files by their size and modification time"""
+    stats = []
+    for path in sorted(paths):
+        st = os.stat(path)
+        stats.append([path, st.st_size, repr(st.st_mtime)])
+    return fingerprint(stats)
+
+
+def find_targets(appmap):
+    """Get (url, fingerprint) for the root and every data Resource list and item."""
+    targets = [('/', fingerprint(sorted(appmap)))]
+    for prefix, resource in sorted(appmap.items()):
+        if not isinstance(resource, data.Resource):
+            continue  # needs query args, so there's nothing to pre-render
+        try:
+            data_map = resource.data_map
+        except (IOError, OSError) as e:
+            logger.warning('Skipping {}: {}'.format(prefix, e))
+            continue
+        item_prints = {}
+        for uid, item in data_map.items():
+            if '/' in uid or uid in ('.', '..'):
+                logger.warning('Skipping {}{}/: not a safe filename'.format(prefix, uid))
+                continue
+            item_prints[uid] = source_fingerprint(item.source_paths())
+            targets.append(('{}/{}/'.format(prefix, uid), item_prints[uid]))
+        targets.append(('{}/'.format(prefix), fingerprint(sorted(item_prints.items()))))
+    return targets
+
+
+def render(app, url):
+    app_iter, status, headers = run_wsgi_app(app, create_environ(url))
+    try:
+        body = b''.join(app_iter)
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+    if not status.startswith('200'):
+        raise ExportError('{} responded with {}'.format(url, status))
+    return body
+
+
+def replace_file(path, content, compress=False):
+    """Write a file atomically, so that a server never sends half of it."""
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'wb') as f:
+        if compress:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as gz:
+                gz.write(content)
+        else:
+            f.write(content)
+    data.rename_over(temp_path, path)
+
+
+def make_dirs(path):
+    """Make a directory and its parents, unless another worker already did."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def url_filename(url):
+    return os.path.join(*(url.strip('/').split('/') + ['index.json']))
+
+
+def export_static(app, appmap, out_dir, threads=8):
+    """Render every data endpoint of `app` into `out_dir`, with a pool of threads.
+
+    Returns (number of endpoints rendered, number skipped as unchanged).
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            previous = json.load(f)['files']
+    except (IOError, OSError, ValueError, KeyError):
+        previous = {}
+
+    def export_one(target):
+        url, source_print = target
+        filename = url_filename(url)
+        path = os.path.join(out_dir, filename)
+        old = previous.get(url)
+        unchanged = old is not None and old['fingerprint'] == source_print
+        if unchanged and os.path.exists(path) and os.path.exists('{}.gz'.format(path)):
+            return url, old, False
+        body = render(app, url)
+        make_dirs(os.path.dirname(path))
+        replace_file(path, body)
+        replace_file('{}.gz'.format(path), body, compress=True)
+        return url, {'path': filename, 'fingerprint': source_print,
+                     'sha1': hashlib.sha1(body).hexdigest(), 'size': len(body)}, True
+
+    targets = find_targets(appmap)
+    pool = ThreadPool(threads)
+    try:
+        results = pool.map(export_one, targets)
+    finally:
+        pool.close()
+
+    files = {url: entry for url, entry, _ in results}
+    for url, entry in previous.items():
+        if url not in files:  # the item is gone, so its files are stale
+            for stale in (entry['path'], '{}.gz'.format(entry['path'])):
+                if os.path.exists(os.path.join(out_dir, stale)):
+                    os.remove(os.path.join(out_dir, stale))
+
+    replace_file(manifest_path, json.dumps({'files': files}, indent=2, sort_keys=True).encode('utf-8'))
+    rendered = sum(1 for _, _, was_rendered in results if was_rendered)
+    return rendered, len(results) - rendered
@@ -89,9 +89,13 @@ class FieldLimiter(BeforeAfterMiddleware):
     Limit fields by providing field= query args. EG:
     GET http://whatever/?field=code&field=subject
 
-    The limits only work for top-level keys in structured response bodies.
+    The limits only work for top-level keys in structured response bodies,
+    except for batch entries ({"uid", "status", "item"}), which have their
+    item limited instead.
     """
 
+    batch_entry_keys = {'uid', 'status', 'item'}
+
     def limit(self, data, fields):
         # have they asked for fields that don't exist?
         if not all(field in data for field in fields):
@@ -99,6 +103,12 @@ class FieldLimiter(BeforeAfterMiddleware):
         limited = {key: data[key] for key in fields}
         return limited
 
+    def limit_entry(self, entry, fields):
+        if isinstance(entry, dict) and set(entry) == self.batch_entry_keys:
+            item = entry['item']
+            return dict(entry, item=None if item is None else self.limit(item, fields))
+        return self.limit(entry, fields)
+
     def after(self, request, response):
         if 'field' not in request.args:
             return
@@ -109,7 +119,7 @@ class FieldLimiter(BeforeAfterMiddleware):
         data = json.loads(body)
 
         if isinstance(data, list):
-            limited_data = [self.limit(d, fields) for d in data]
+            limited_data = [self.limit_entry(d, fields) for d in data]
         else:
             limited_data = self.limit(data, fields)
 
@@ -118,9 +128,15 @@ class FieldLimiter(BeforeAfterMiddleware):
 
 
 class PrettyJSON(BeforeAfterMiddleware):
-    """Prettify JSON responses"""
+    """Prettify JSON responses when asked to with a ?pretty query parameter.
+
+    Other responses are passed through untouched, so the bytes resources
+    have already encoded aren't parsed and serialized all over again.
+    """
 
     def after(self, request, response):
+        if 'pretty' not in request.args:
+            return
         if response.headers.get('Content-Type') == 'application/json':
             body = response.get_data(as_text=True)
             data = json.loads(body)
@@ -0,0 +1,255 @@
+"""
+    api.occupancy
+    ~~~~~~~~~~~~~
+
+    Index when rooms and instructors are booked, from every course timeslot.
+
+
+    Bookings are grouped by term, then by room or instructor, and then by day
+    of the week. Each day's bookings go into a centered interval tree, so
+    finding what is happening at a given time takes O(log n + k), even when
+    some bookings last all day.
+"""
+
+import logging
+from collections import namedtuple
+from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.routing import Map, Rule
+from api import config
+from api import data
+from api.cache import LRUCache
+from api.timetable import parse_time
+
+
+logger = logging.getLogger(__name__)
+
+INSTRUCTOR_REF = 'instructors/'
+
+
+# `details` is a copy of the timeslot's fields, plus the section's type and id,
+# so that indexes don't keep whole term documents alive
+Booking = namedtuple('Booking', 'day start end course term details')
+
+
+class IntervalTree(object):
+    """A centered interval tree of bookings, covering [start, end) minutes.
+
+    Each node keeps the bookings that span its center, sorted both ways, and
+    hands the ones entirely before or after it to its children. The center is
+    the median start time, so each child gets at most half of the bookings.
+    """
+
+    def __init__(self, bookings):
+        starts = sorted(b.start for b in bookings)
+        self.center = center = starts[len(starts) // 2]
+        before = [b for b in bookings if b.start < center and b.end <= center]
+        after = [b for b in bookings if b.start > center]
+        here = [b for b in bookings if b.start <= center and (b.end > center or b.start == center)]
+        self.by_start = sorted(here, key=lambda b: b.start)
+        self.by_end = sorted(here, key=lambda b: b.end, reverse=True)
+        self.before = IntervalTree(before) if before else None
+        self.after = IntervalTree(after) if after else None
+
+    def at(self, minute):
+        """Get the bookings with start <= minute < end"""
+        found = []
+        node = self
+        while node is not None:
+            if minute < node.center:
+                # everything here ends after the center, so check the starts
+                for booking in node.by_start:
+                    if booking.start > minute:
+                        break
+                    found.append(booking)
+                node = node.before
+            else:
+                # everything here starts by the center, so check the ends
+                for booking in node.by_end:
+                    if booking.end <= minute:
+                        break
+                    found.append(booking)
+                node = node.after
+        return found
+
+
+class DayIntervals(object):
+    """The bookings for one day, sorted by start time"""
+
+    def __init__(self, bookings):
+        self.bookings = sorted(bookings, key=lambda b: (b.start, b.end))
+        self.tree = IntervalTree(self.bookings) if self.bookings else None
+
+    def at(self, minute):
+        """Get the bookings with start <= minute < end, sorted by start time"""
+        if self.tree is None:
+            return []
+        return sorted(self.tree.at(minute), key=lambda b: (b.start, b.end))
+
+
+def build_days(bookings):
+    by_day = {}
+    for booking in bookings:
+        by_day.setdefault(booking.day, []).append(booking)
+    return {day: DayIntervals(day_bookings) for day, day_bookings in by_day.items()}
+
+
+def iter_bookings(course_map, term):
+    for uid, course in course_map.items():
+        for term_doc in course.get_terms([term]):
+            for section in term_doc.get('sections') or []:
+                solus = section.get('solus') or {}
+                for timeslot in section.get('timeslots') or []:
+                    try:
+                        booking = Booking(day=int(timeslot['day_of_week']),
+                                          start=parse_time(timeslot['start_time']),
+                                          end=parse_time(timeslot['end_time']),
+                                          course=uid,
+                                          term=term,
+                                          details=dict(timeslot, type=section.get('type'), section=solus.get('id')))
+                    except (KeyError, TypeError, ValueError) as e:
+                        # one bad timeslot shouldn't take down the whole term's index
+                        logger.warning('Skipping a timeslot of {} in {}: {}'.format(uid, term, e))
+                        continue
+                    yield booking
+
+
+def build_index(course_map, term):
+    """Build {room: {day: DayIntervals}} and {instructor uid: {day: DayIntervals}} for a term"""
+    rooms = {}
+    instructors = {}
+    for booking in iter_bookings(course_map, term):
+        location = booking.details.get('location')
+        if location:
+            rooms.setdefault(location, []).append(booking)
+        for ref in booking.details.get('instructors') or []:
+            if ref.startswith(INSTRUCTOR_REF):  # skip placeholders like "Staff"
+                instructors.setdefault(ref[len(INSTRUCTOR_REF):], []).append(booking)
+    return ({room: build_days(b) for room, b in rooms.items()},
+            {uid: build_days(b) for uid, b in instructors.items()})
+
+
+class Occupancy(object):
+    """Room and instructor indexes over a course Resource, built lazily per term.
+
+    Without any terms asked for, only the latest term in the course manifests
+    is used, so old terms are never parsed unless a request names them.
+    """
+
+    def __init__(self, courses):
+        self.courses = courses
+        self._indexes = LRUCache(int(config['TERM_CACHE_SIZE']))  # (rooms, instructors) by term key
+        courses.listeners.append(self.forget)
+
+    def forget(self, uid):
+        """Drop the indexes for the terms a changed course appears in"""
+        course = self.courses.data_map.get(uid, None)
+        for term in (course.term_manifest if course is not None else []):
+            self._indexes.pop(term)
+
+    def get_index(self, term):
+        index = self._indexes.get(term)
+        if index is None:
+            index = self._indexes[term] = build_index(self.courses.data_map, term)
+        return index
+
+    def latest_term(self):
+        """Get the most recent term key of any course, without parsing any terms"""
+        latest = [next(reversed(c.term_manifest)) for c in self.courses.data_map.values() if c.term_manifest]
+        return max(latest, key=data.term_sort_key) if latest else None
+
+    def default_terms(self, terms):
+        if terms is None:
+            latest = self.latest_term()
+            return [latest] if latest is not None else []
+        if data.ALL_TERMS in terms:
+            keys = set(key for c in self.courses.data_map.values() for key in c.term_manifest)
+            return sorted(keys, key=data.term_sort_key)
+        return terms
+
+    def rooms(self, terms=None):
+        """Get the {day: DayIntervals} room maps for some terms, or the latest term"""
+        return [self.get_index(term)[0] for term in self.default_terms(terms)]
+
+    def instructors(self, terms=None):
+        """Get the {day: DayIntervals} instructor maps for some terms, or the latest term"""
+        return [self.get_index(term)[1] for term in self.default_terms(terms)]
+
+
+def query(days_maps, request):
+    """Collect bookings from {day: DayIntervals} maps, filtered by the day= and time= query args"""
+    if 'at' in request.args:  # ?at= is a revision on data resources, which occupancy doesn't support
+        raise BadRequest('Bookings are only for the current data, use time=HH:MM for the time of day')
+    try:
+        day = int(request.args['day']) if 'day' in request.args else None
+        minute = parse_time(request.args['time']) if 'time' in request.args else None
+    except ValueError:
+        raise BadRequest('day must be an integer and time must look like HH:MM')
+
+    found = []
+    for days in days_maps:
+        if day is None:
+            selected = days.values()
+        else:
+            selected = [days[day]] if day in days else []
+        for intervals in selected:
+            found.extend(intervals.bookings if minute is None else intervals.at(minute))
+    found.sort(key=lambda b: (b.day, b.start, b.end, b.term))
+    return [booking_json(b) for b in found]
+
+
+def booking_json(booking):
+    return dict(booking.details, course=booking.course, term=booking.term)
+
+
+class Rooms(data.BaseResource):
+    """Serve room bookings
+
+    GET /                         list the rooms
+    GET /<name>/?day=2&time=12:30 bookings in a room, optionally filtered by
+                                  day and time
+
+    Both use the latest term, unless others are given with ?term=fall-2013,
+    or every term with ?term=all
+    """
+
+    def __init__(self, occupancy):
+        self.url_map = Map([
+            Rule('/', methods=['GET'], endpoint=self.list_handler),
+            Rule('/<name>/', methods=['GET'], endpoint=self.room_handler),
+        ])
+        self.occupancy = occupancy
+
+    def list_handler(self, request):
+        rooms = set()
+        for room_map in self.occupancy.rooms(data.requested_terms(request)):
+            rooms.update(room_map)
+        return self.render_json(sorted(rooms))
+
+    def room_handler(self, request, name):
+        room_maps = self.occupancy.rooms(data.requested_terms(request))
+        days_maps = [room_map[name] for room_map in room_maps if name in room_map]
+        if not days_maps:
+            raise NotFound()
+        return self.render_json(query(days_maps, request))
+
+
+class InstructorResource(data.Resource):
+    """Instructor data, plus each instructor's teaching schedule
+
+    GET /<uid>/schedule/?day=2&time=12:30&term=fall-2013
+
+    Without term=, the latest term is used. Schedules are always built from
+    the current data, so unlike the instructor data, they don't take ?at=.
+    """
+
+    def __init__(self, occupancy):
+        super(InstructorResource, self).__init__(provider_class=data.Instructor)
+        self.url_map.add(Rule('/<uid>/schedule/', methods=['GET'], endpoint=self.schedule_handler))
+        self.occupancy = occupancy
+
+    def schedule_handler(self, request, uid):
+        instructor_maps = self.occupancy.instructors(data.requested_terms(request))
+        days_maps = [instructor_map[uid] for instructor_map in instructor_maps if uid in instructor_map]
+        if not days_maps and uid not in self.data_map:
+            raise NotFound()
+        return self.render_json(query(days_maps, request))
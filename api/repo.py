@@ -5,11 +5,21 @@
     Wrap functionality for the git repo behind the filesystem db.
 """
 
+import io
 import os
+import re
+import time
+import errno
+import atexit
+import logging
 import subprocess
+from threading import Lock, Thread
 from api import config, ConfigException
 
 
+logger = logging.getLogger(__name__)
+
+
 class NotEmptyRepoError(IOError):
     """Raised when an empty folder was expected, ie., for cloning."""
 
@@ -34,3 +44,192 @@ def clone():
 
     # grab some data!
     subprocess.check_call(['git', 'clone', repo_uri, repo_dir])
+
+
+def git(*args):
+    """Run a git command in the data repo, returning its output."""
+    return subprocess.check_output(('git',) + args, cwd=config['DATA_LOCAL'])
+
+
+DATE = re.compile(r'^\d{4}-\d{2}-\d{2}([ T][\d:]+)?$')
+
+
+class CatFile(object):
+    """Read objects from the data repo through one long-running `git cat-file --batch`.
+
+    Starting git for every file would dominate the time spent reading old
+    revisions, so requests share a single process, one at a time.
+    """
+
+    def __init__(self):
+        self._process = None
+        self._repo_dir = None
+        self._lock = Lock()
+
+    def _get_process(self):
+        repo_dir = config['DATA_LOCAL']
+        if self._process is None or self._process.poll() is not None or self._repo_dir != repo_dir:
+            self.close()
+            self._process = subprocess.Popen(['git', 'cat-file', '--batch'], cwd=repo_dir,
+                                             stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._repo_dir = repo_dir
+        return self._process
+
+    def get(self, name):
+        """Get (sha, type, content) for an object name like `<rev>:<path>`, or None if there isn't one."""
+        if '\n' in name:
+            return None
+        with self._lock:
+            process = self._get_process()
+            process.stdin.write(name.encode('utf-8') + b'\n')
+            process.stdin.flush()
+            header = process.stdout.readline()
+            if not header or header.endswith(b' missing\n') or header.endswith(b' ambiguous\n'):
+                return None
+            sha, kind, size = header.decode('ascii').split()
+            content = process.stdout.read(int(size))
+            process.stdout.read(1)  # trailing newline
+            return sha, kind, content
+
+    def close(self):
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+
+
+cat_file = CatFile()
+
+
+def resolve(rev):
+    """Get the full sha of the commit for a commit-ish or a YYYY-MM-DD date, or None.
+
+    Dates resolve to the last commit on HEAD before them.
+    """
+    if DATE.match(rev):
+        sha = git('rev-list', '-1', '--before={}'.format(rev), 'HEAD').decode('ascii').strip()
+        return sha or None
+    found = cat_file.get('{}^{{commit}}'.format(rev))
+    return found[0] if found is not None else None
+
+
+class WorkingTree(object):
+    """Read data files from the data repo's checkout."""
+
+    cache_key = None  # stands in for a revision when caching things read from here
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def open(self, path):
+        return open(path)
+
+
+class Revision(object):
+    """Read data files as they were at a commit, straight from git objects.
+
+    Paths are given as if the commit were checked out in DATA_LOCAL.
+    """
+
+    def __init__(self, sha):
+        self.sha = sha
+        self.cache_key = sha
+        self._dirs = None
+
+    def _relpath(self, path):
+        return os.path.relpath(path, config['DATA_LOCAL']).replace(os.sep, '/')
+
+    def _not_found(self, path):
+        return OSError(errno.ENOENT, 'Not in revision {}'.format(self.sha), path)
+
+    def listdir(self, path):
+        if self._dirs is None:
+            # list every file once, rather than asking git about each folder
+            dirs = {}
+            for filename in git('ls-tree', '-r', '-z', '--name-only', self.sha).decode('utf-8').split('\0'):
+                parts = filename.split('/')
+                for i in range(1, len(parts)):
+                    dirs.setdefault('/'.join(parts[:i]), set()).add(parts[i])
+            self._dirs = dirs
+        try:
+            return sorted(self._dirs[self._relpath(path)])
+        except KeyError:
+            raise self._not_found(path)
+
+    def open(self, path):
+        found = cat_file.get('{}:{}'.format(self.sha, self._relpath(path)))
+        if found is None or found[1] != 'blob':
+            raise self._not_found(path)
+        return io.BytesIO(found[2])
+
+
+working_tree = WorkingTree()
+
+
+class CommitQueue(object):
+    """Collect changed data files and commit them to the data repo in batches.
+
+    Writers only `add` paths to a pending set, so they never wait on git. A
+    background thread commits everything pending once every `interval`
+    seconds, then pushes to PUSH_REMOTE. With no interval, nothing happens
+    until `flush` is called.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._pending = set()
+        self._messages = []
+        self._lock = Lock()  # guards the pending paths and messages
+        self._git_lock = Lock()  # one flush at a time
+        self._thread = None
+
+    def add(self, paths, message):
+        with self._lock:
+            self._pending.update(os.path.relpath(p, config['DATA_LOCAL']) for p in paths)
+            self._messages.append(message)
+            if self.interval is not None and self._thread is None:
+                self._thread = Thread(target=self.run, name='commit-queue')
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                # keep the thread alive, or nothing would ever be committed again
+                logger.exception('Failed to commit data changes')
+
+    def flush(self):
+        """Commit everything pending as one commit, and push it.
+
+        Returns True if a commit was made.
+        """
+        with self._git_lock:
+            with self._lock:
+                paths, self._pending = sorted(self._pending), set()
+                messages, self._messages = self._messages, []
+            if not paths:
+                return False
+
+            git('add', '--', *paths)
+            if subprocess.call(['git', 'diff', '--cached', '--quiet'], cwd=config['DATA_LOCAL']) == 0:
+                return False  # the writes didn't actually change anything
+            summary = 'Update {} item{} through the api'.format(len(messages), '' if len(messages) == 1 else 's')
+            git('-c', 'user.name={}'.format(config['COMMIT_NAME']),
+                '-c', 'user.email={}'.format(config['COMMIT_EMAIL']),
+                'commit', '--quiet', '-m', summary, '-m', '\n'.join(messages))
+
+            remote = config['PUSH_REMOTE']
+            if remote:
+                try:
+                    git('push', '--quiet', remote, 'HEAD')
+                except subprocess.CalledProcessError:
+                    # the commit is safe locally, and will go out with the next push
+                    logger.exception('Failed to push data changes to {}'.format(remote))
+            return True
+
+
+commit_queue = CommitQueue(interval=float(config['COMMIT_INTERVAL']))
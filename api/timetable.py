@@ -0,0 +1,205 @@
+"""
+    api.timetable
+    ~~~~~~~~~~~~~
+
+    Find combinations of course sections that don't clash.
+
+
+    Every section's timeslots are compiled once per term into `Interval`s
+    (minutes past midnight, per day of the week) and a bitmask over the week,
+    with one bit for each `SLOT_MINUTES` slot. Two sections whose masks don't
+    intersect can't conflict, so the exact interval comparisons only run for
+    the few candidates that share a slot.
+"""
+
+import time
+from collections import namedtuple
+from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.routing import Map, Rule
+from api import config
+from api.data import BaseResource, term_key
+from api.cache import LRUCache
+
+
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# Unknown term dates are left open-ended
+FIRST_DATE = '0000-00-00'
+LAST_DATE = '9999-99-99'
+
+
+Interval = namedtuple('Interval', 'day start end term_start term_end')
+Section = namedtuple('Section', 'course type id index mask intervals')
+
+
+def parse_time(hhmm):
+    """Convert an "HH:MM" string to minutes past midnight"""
+    hours, minutes = str(hhmm).split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def compile_interval(timeslot):
+    return Interval(day=int(timeslot['day_of_week']),
+                    start=parse_time(timeslot['start_time']),
+                    end=parse_time(timeslot['end_time']),
+                    term_start=str(timeslot.get('term_start') or FIRST_DATE),
+                    term_end=str(timeslot.get('term_end') or LAST_DATE))
+
+
+def interval_mask(interval):
+    """Set a bit for every slot the interval touches, rounding outwards"""
+    first = interval.day * SLOTS_PER_DAY + interval.start // SLOT_MINUTES
+    last = interval.day * SLOTS_PER_DAY + -(-interval.end // SLOT_MINUTES)
+    return ((1 << (last - first)) - 1) << first
+
+
+def compile_section(course_uid, section):
+    intervals = tuple(compile_interval(t) for t in section.get('timeslots') or [])
+    mask = 0
+    for interval in intervals:
+        mask |= interval_mask(interval)
+    solus = section.get('solus') or {}
+    return Section(course=course_uid, type=section.get('type'), id=solus.get('id'),
+                   index=solus.get('index'), mask=mask, intervals=intervals)
+
+
+def compile_term(course_uid, term):
+    """Group a term's compiled sections by type, keeping the document's order.
+
+    A schedule needs one section of every type (lecture, lab, ...) for each
+    course, so each group is one choice to make.
+    """
+    groups = []
+    by_type = {}
+    for section in term.get('sections') or []:
+        compiled = compile_section(course_uid, section)
+        if compiled.type not in by_type:
+            by_type[compiled.type] = []
+            groups.append(by_type[compiled.type])
+        by_type[compiled.type].append(compiled)
+    return groups
+
+
+def intervals_overlap(a, b):
+    return (a.day == b.day and a.start < b.end and b.start < a.end and
+            a.term_start <= b.term_end and b.term_start <= a.term_end)
+
+
+def sections_conflict(a, b):
+    if not a.mask & b.mask:
+        return False
+    return any(intervals_overlap(x, y) for x in a.intervals for y in b.intervals)
+
+
+def find_schedules(groups, limit, deadline):
+    """Pick one section from each group so that no two picks conflict.
+
+    Returns at most `limit` schedules (lists of sections, in group order),
+    and whether the search finished, rather than finding more than `limit`
+    or running past the `deadline` (a `time.time()` value).
+    """
+    # Choosing from the smallest groups first prunes the most branches early
+    order = sorted(range(len(groups)), key=lambda i: len(groups[i]))
+    found = []
+    chosen = [None] * len(groups)
+
+    def search(depth, occupied):
+        if depth == len(order):
+            found.append(list(chosen))
+            return len(found) <= limit  # one extra tells us there were more
+        if time.time() > deadline:
+            return False
+        group_index = order[depth]
+        for section in groups[group_index]:
+            if section.mask & occupied and any(sections_conflict(section, other)
+                                               for other in chosen if other is not None):
+                continue
+            chosen[group_index] = section
+            keep_going = search(depth + 1, occupied | section.mask)
+            chosen[group_index] = None
+            if not keep_going:
+                return False
+        return True
+
+    complete = search(0, 0)
+    return found[:limit], complete
+
+
+class Schedules(BaseResource):
+    """Serve conflict-free section combinations for a set of courses.
+
+    GET /?courses=CISC220,CISC124&term=fall-2013[&limit=20]
+
+    At most `limit` schedules are returned, and the search gives up after
+    `time_budget` seconds. Either way, `truncated` is set in the response if
+    the search stopped early.
+    """
+
+    default_limit = 50
+    max_limit = 500
+    time_budget = 0.5  # seconds
+
+    def __init__(self, courses):
+        self.url_map = Map([
+            Rule('/', methods=['GET'], endpoint=self.schedules_handler),
+        ])
+        self.courses = courses
+        # compiled groups by (course uid, term key), bounded like the terms they come from
+        self._groups = LRUCache(int(config['TERM_CACHE_SIZE']))
+        courses.listeners.append(self.forget)
+
+    def forget(self, uid):
+        """Drop compiled groups for a course that changed"""
+        for key in self._groups.keys():
+            if key[0] == uid:
+                self._groups.pop(key)
+
+    def get_groups(self, uid, term):
+        """Compile a course's sections for a term, only parsing that term"""
+        groups = self._groups.get((uid, term))
+        if groups is None:
+            course = self.courses.data_map.get(uid, None)
+            if course is None:
+                raise NotFound('No course {}'.format(uid))
+            terms = course.get_terms([term])
+            if not terms:
+                raise NotFound('{} is not offered in {}'.format(uid, term))
+            groups = self._groups[uid, term] = compile_term(uid, terms[0])
+        return groups
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.args.get('limit', self.default_limit))
+        except ValueError:
+            raise BadRequest('limit must be an integer')
+        if not 0 < limit <= self.max_limit:
+            raise BadRequest('limit must be between 1 and {}'.format(self.max_limit))
+        return limit
+
+    def schedules_handler(self, request):
+        uids = []
+        for uid in request.args.get('courses', '').split(','):
+            uid = uid.strip()
+            if uid and uid not in uids:  # a repeated course would conflict with itself
+                uids.append(uid)
+        term = request.args.get('term', '').lower()
+        if not uids or not term:
+            raise BadRequest('Both courses= and term= are required')
+        limit = self.get_limit(request)
+
+        groups = []
+        for uid in uids:
+            groups.extend(self.get_groups(uid, term))
+
+        schedules, complete = find_schedules(groups, limit, time.time() + self.time_budget)
+        return self.render_json({
+            'term': term,
+            'courses': uids,
+            'schedules': [[self.section_json(s) for s in schedule] for schedule in schedules],
+            'truncated': not complete,
+        })
+
+    def section_json(self, section):
+        return {'course': section.course, 'type': section.type,
+                'id': section.id, 'index': section.index}
@@ -67,6 +67,20 @@ def runserver(host="127.0.0.1", port="5000"):
     run_simple(host, port_num, app, use_debugger=True, use_reloader=True)
 
 
+@command
+def export(out_dir, threads="8"):
+    """Pre-render every resource and item to static files in a directory"""
+    try:
+        num_threads = int(threads)
+    except ValueError:
+        print('The number of threads must be an integer (got "{}")'.format(threads))
+        raise SystemExit(1)
+    import api
+    from api.export import export_static
+    rendered, unchanged = export_static(api.app, api.dispatch_appmap, out_dir, threads=num_threads)
+    print('Rendered {} endpoints to {} ({} unchanged)'.format(rendered, out_dir, unchanged))
+
+
 @command
 def clean():
     """Clean up __pycache__ folders (left behind from testing perhaps)"""
@@ -9,6 +9,7 @@
 """
 
 import os
+import gzip
 import json
 import shutil
 import tarfile
@@ -19,6 +20,7 @@ from werkzeug.wrappers import BaseResponse
 from werkzeug.exceptions import NotAcceptable, BadRequest, NotFound
 
 import api
+import api.export
 from api.config import (
     REQUIRED,
     variables,
@@ -238,3 +240,530 @@ class TestJsonifyHttpException(TestCase):
 
         response = client.get('/alwaysbad')
         self.assertEqual(response.headers['Content-Type'], 'application/json')
+
+
+class TestResource(TestCase):
+    local_repo = os.path.join(os.getcwd(), 'test', 'test_repo')
+
+    @classmethod
+    def setUpClass(cls):
+        with tarfile.open('{}.tar'.format(cls.local_repo)) as t:
+            t.extractall()
+
+    def setUp(self):
+        api.config.update(DATA_LOCAL=self.local_repo)
+        self.resource = api.data.Resource(provider_class=api.data.Course)
+        self.client = Client(self.resource, BaseResponse)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.local_repo)
+
+    def test_item(self):
+        resp = self.client.get('/CISC220/')
+        self.assertEqual(json_resp(resp)['number'], '220')
+        self.assertEqual(self.client.get('/CISC999/').status_code, 404)
+
+    def test_lazy_terms(self):
+        api.data.term_cache.clear()
+        course = self.resource.data_map['CISC220']
+        self.assertEqual(list(course.term_manifest), ['fall-2013'])
+        self.assertNotIn('terms', course)
+        self.assertEqual(len(api.data.term_cache), 0)
+
+        resp = self.client.get('/CISC220/?term=winter-2014')
+        self.assertEqual(json_resp(resp)['terms'], [])
+        self.assertEqual(len(api.data.term_cache), 0)
+
+        resp = self.client.get('/CISC220/?term=fall-2013')
+        self.assertEqual([t['season'] for t in json_resp(resp)['terms']], ['fall'])
+        self.assertEqual(len(api.data.term_cache), 1)
+
+    def test_list(self):
+        resp = self.client.get('/')
+        self.assertEqual([c['number'] for c in json_resp(resp)], ['220'])
+
+    def test_batch_get(self):
+        resp = self.client.get('/?ids=CISC220,CISC999')
+        self.assertEqual(resp.status_code, 200)
+        found, missing = json_resp(resp)
+        self.assertEqual((found['uid'], found['status']), ('CISC220', 200))
+        self.assertEqual(found['item'], self.resource.data_map['CISC220'].dump())
+        self.assertEqual(missing, {'uid': 'CISC999', 'status': 404, 'item': None})
+
+    def test_batch_field_limit(self):
+        app = api.middleware.JsonifyHttpException(api.middleware.FieldLimiter(self.resource))
+        resp = Client(app, BaseResponse).get('/?ids=CISC220,CISC999&field=title')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json_resp(resp), [
+            {'uid': 'CISC220', 'status': 200, 'item': {'title': 'System Level Programming'}},
+            {'uid': 'CISC999', 'status': 404, 'item': None},
+        ])
+
+    def test_batch_through_middleware(self):
+        app = api.middleware.PrettyJSON(api.middleware.JsonifyHttpException(
+            api.middleware.FieldLimiter(self.resource)))
+        client = Client(app, BaseResponse)
+        resp = client.get('/?ids=CISC220,CISC999')
+        self.assertEqual(resp.get_data(), self.client.get('/?ids=CISC220,CISC999').get_data())
+        pretty = client.get('/?ids=CISC220,CISC999&pretty')
+        self.assertIn(b'\n  {', pretty.get_data())
+        self.assertEqual(json_resp(pretty), json_resp(resp))
+
+    def test_batch_post(self):
+        resp = self.client.post('/', data=json.dumps({'ids': ['CISC220']}))
+        self.assertEqual([e['uid'] for e in json_resp(resp)], ['CISC220'])
+        self.assertEqual(self.client.post('/', data='nope').status_code, 400)
+        too_many = json.dumps({'ids': ['CISC220'] * (self.resource.max_batch_size + 1)})
+        self.assertEqual(self.client.post('/', data=too_many).status_code, 400)
+
+    def test_schedules_resource(self):
+        client = Client(api.timetable.Schedules(self.resource), BaseResponse)
+
+        resp = client.get('/?courses=CISC220&term=fall-2013')
+        data = json_resp(resp)
+        self.assertFalse(data['truncated'])
+        self.assertEqual(sorted(s[1]['id'] for s in data['schedules']), ['2429', '2431'])
+
+        data = json_resp(client.get('/?courses=CISC220&term=fall-2013&limit=2'))
+        self.assertEqual((len(data['schedules']), data['truncated']), (2, False))
+        data = json_resp(client.get('/?courses=CISC220&term=fall-2013&limit=1'))
+        self.assertEqual((len(data['schedules']), data['truncated']), (1, True))
+
+        data = json_resp(client.get('/?courses=CISC220,CISC220&term=fall-2013'))
+        self.assertEqual(data['courses'], ['CISC220'])
+        self.assertEqual(len(data['schedules']), 2)
+
+        self.assertEqual(client.get('/?courses=CISC220&term=winter-2014').status_code, 404)
+        self.assertEqual(client.get('/?courses=CISC999&term=fall-2013').status_code, 404)
+        self.assertEqual(client.get('/?courses=CISC220').status_code, 400)
+        self.assertEqual(client.get('/?courses=CISC220&term=fall-2013&limit=0').status_code, 400)
+
+
+class TestWrites(TestCase):
+    local_repo = TestResource.local_repo
+    auth = {'Authorization': 'Bearer sekrit'}
+
+    def setUp(self):
+        with tarfile.open('{}.tar'.format(self.local_repo)) as t:
+            t.extractall()
+        api.config.update(DATA_LOCAL=self.local_repo, WRITE_TOKEN='sekrit', PUSH_REMOTE='')
+        self.queue = api.repo.CommitQueue()
+        self.resource = api.data.Resource(provider_class=api.data.Course, commit_queue=self.queue)
+        self.client = Client(self.resource, BaseResponse)
+
+    def tearDown(self):
+        api.config.update(WRITE_TOKEN=None)
+        api.repo.cat_file.close()
+        shutil.rmtree(self.local_repo)
+
+    def commit_count(self):
+        return len(api.repo.git('rev-list', 'HEAD').splitlines())
+
+    def test_patch(self):
+        changed = []
+        self.resource.listeners.append(changed.append)
+        resp = self.client.patch('/CISC220/', data=json.dumps({'title': 'Systems'}), headers=self.auth)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json_resp(resp)['title'], 'Systems')
+        self.assertEqual(json_resp(self.client.get('/CISC220/'))['title'], 'Systems')
+        self.assertEqual(changed, ['CISC220'])
+
+        course_file = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220', 'course.yml')
+        with open(course_file) as f:
+            self.assertEqual(api.data.yaml.safe_load(f)['title'], 'Systems')
+
+    def test_put_terms(self):
+        term = {'season': 'winter', 'year': '2014', 'sections': []}
+        course = dict(self.resource.data_map['CISC220'], terms=[term])
+        api.data.term_cache.clear()
+        resp = self.client.put('/CISC220/', data=json.dumps(course), headers=self.auth)
+        self.assertEqual([t['season'] for t in json_resp(resp)['terms']], ['winter'])  # only the latest
+        resp = self.client.get('/CISC220/')
+        self.assertEqual([t['season'] for t in json_resp(resp)['terms']], ['winter'])
+        self.assertEqual([key[2] for key in api.data.term_cache.keys()], ['winter-2014'])
+        resp = self.client.get('/CISC220/?term=all')
+        self.assertEqual([t['season'] for t in json_resp(resp)['terms']], ['fall', 'winter'])
+        self.assertNotIn((None, 'CISC220', ('all',)), self.resource._encoded)
+
+        bad_term = dict(term, season='../../oops')
+        resp = self.client.put('/CISC220/', data=json.dumps(dict(course, terms=[bad_term])), headers=self.auth)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_invalid_terms(self):
+        timeslot = {'day_of_week': 2, 'start_time': '12:30', 'end_time': '13:30', 'location': 'Dunning'}
+        term_file = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220', 'term-fall-2013.yml')
+        with open(term_file) as f:
+            before = f.read()
+
+        def patch_sections(sections):
+            term = {'season': 'fall', 'year': '2013', 'sections': sections}
+            return self.client.patch('/CISC220/', data=json.dumps({'terms': [term]}), headers=self.auth)
+        for sections in ('oops', ['oops'],
+                         [{'timeslots': 'oops'}],
+                         [{'timeslots': [dict(timeslot, start_time='TBA')]}],
+                         [{'timeslots': [dict(timeslot, day_of_week='Tuesday')]}],
+                         [{'timeslots': [dict(timeslot, end_time='11:00')]}],
+                         [{'timeslots': [dict(timeslot, instructors=[5])]}]):
+            self.assertEqual(patch_sections(sections).status_code, 400, sections)
+        with open(term_file) as f:
+            self.assertEqual(f.read(), before)
+
+        self.assertEqual(patch_sections([{'type': 'lecture', 'timeslots': [timeslot]}]).status_code, 200)
+        rooms = Client(api.occupancy.Rooms(api.occupancy.Occupancy(self.resource)), BaseResponse)
+        self.assertEqual(json_resp(rooms.get('/?term=fall-2013')), ['Dunning'])
+
+    def test_stale_term_readers(self):
+        old = self.resource.data_map['CISC220']
+        stale = old.get_terms(['fall-2013'])[0]
+        term = dict(stale, sections=[])
+        self.client.patch('/CISC220/', data=json.dumps({'terms': [term]}), headers=self.auth)
+
+        # a reader of the old course that read the file just before it was replaced
+        api.data.term_cache.clear()
+        old.load_yaml = lambda path: stale
+        old.get_terms(['fall-2013'])
+        new = self.resource.data_map['CISC220']
+        self.assertEqual(new.get_terms(['fall-2013'])[0]['sections'], [])
+
+    def test_forget_written_terms(self):
+        occupancy = api.occupancy.Occupancy(self.resource)
+        occupancy.get_index('fall-2013')
+        occupancy._indexes['winter-2000'] = ({}, {})  # no course here is written to
+        self.client.patch('/CISC220/', data=json.dumps({'title': 'Systems'}), headers=self.auth)
+        self.assertEqual(occupancy._indexes.keys(), ['winter-2000'])
+
+    def test_invalid_writes(self):
+        def patch(body, **kwargs):
+            return self.client.patch('/CISC220/', data=json.dumps(body), **kwargs)
+        self.assertEqual(patch({'title': 'x'}).status_code, 401)
+        self.assertEqual(patch({'title': 'x'}, headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        self.assertEqual(patch({'title': 5}, headers=self.auth).status_code, 400)
+        self.assertEqual(patch({'number': '221'}, headers=self.auth).status_code, 400)  # renames
+        self.assertEqual(patch(['title'], headers=self.auth).status_code, 400)
+        self.assertEqual(self.client.patch('/CISC999/', data='{}', headers=self.auth).status_code, 404)
+
+        api.config.update(WRITE_TOKEN=None)
+        self.assertEqual(patch({'title': 'x'}, headers=self.auth).status_code, 403)
+
+    def test_batched_commits(self):
+        before = self.commit_count()
+        for title in ('One', 'Two', 'Three'):
+            self.client.patch('/CISC220/', data=json.dumps({'title': title}), headers=self.auth)
+        self.assertEqual(self.commit_count(), before)  # nothing committed until the queue flushes
+        self.assertTrue(self.queue.flush())
+        self.assertEqual(self.commit_count(), before + 1)
+        self.assertFalse(self.queue.flush())
+
+    def test_history(self):
+        first = api.repo.git('rev-parse', 'HEAD').decode('ascii').strip()
+        self.client.patch('/CISC220/', data=json.dumps({'title': 'Systems'}), headers=self.auth)
+        self.queue.flush()
+
+        def title_at(at):
+            return json_resp(self.client.get('/CISC220/?at={}'.format(at)))['title']
+        self.assertEqual(title_at('HEAD'), 'Systems')
+        self.assertEqual(title_at('HEAD~1'), 'System Level Programming')
+        self.assertEqual(title_at(first[:10]), 'System Level Programming')
+        self.assertEqual(title_at('2013-12-15'), 'System Level Programming')
+
+        old = json_resp(self.client.get('/CISC220/?at=HEAD~1&term=fall-2013'))
+        self.assertEqual([t['season'] for t in old['terms']], ['fall'])
+        self.assertEqual(len(json_resp(self.client.get('/?at=HEAD~1'))), 1)
+        self.assertEqual(self.client.get('/?at=2000-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/?at=nonsense').status_code, 400)
+
+        subjects = api.data.Resource(provider_class=api.data.Subject)
+        self.assertEqual(Client(subjects, BaseResponse).get('/?at=HEAD').status_code, 404)
+
+    def test_invalid_history(self):
+        courses_dir = os.path.join(self.local_repo, 'data', 'courses')
+        for name, content in (('cisc-998', 'title: [oops'), ('cisc-999', 'title: No subject\n')):
+            os.mkdir(os.path.join(courses_dir, name))
+            with open(os.path.join(courses_dir, name, 'course.yml'), 'w') as f:
+                f.write(content)
+        with open(os.path.join(courses_dir, 'cisc-220', 'term-fall-2013.yml'), 'w') as f:
+            f.write('sections: [oops')
+        api.repo.git('add', courses_dir)
+        api.repo.git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-qm', 'break')
+
+        self.assertEqual(json_resp(self.client.get('/?at=HEAD')), [])
+        self.assertEqual(self.client.get('/CISC220/?at=HEAD').status_code, 404)
+        self.assertEqual(self.client.get('/CISC220/?at=HEAD&term=winter-2014').status_code, 200)
+        self.assertEqual(self.client.get('/CISC220/?at=HEAD~1').status_code, 200)
+
+    def test_changes(self):
+        first = api.repo.git('rev-parse', 'HEAD').decode('ascii').strip()
+        self.client.patch('/CISC220/', data=json.dumps({'title': 'Systems'}), headers=self.auth)
+        self.queue.flush()
+        client = Client(api.changes.Changes([api.data.Course, api.data.Subject]), BaseResponse)
+
+        data = json_resp(client.get('/?since={}'.format(first)))
+        self.assertEqual(data['since'], first)
+        self.assertEqual(data['until'], api.repo.resolve('HEAD'))
+        self.assertEqual(data['changes']['courses'], {'added': [], 'modified': ['CISC220'], 'removed': []})
+        self.assertEqual(data['changes']['subjects'], {'added': [], 'modified': [], 'removed': []})
+
+        data = json_resp(client.get('/?since=HEAD&until={}'.format(first)))
+        self.assertEqual(data['changes']['courses']['modified'], ['CISC220'])
+        data = json_resp(client.get('/?since=HEAD'))
+        self.assertEqual(data['changes']['courses']['modified'], [])
+        self.assertEqual(client.get('/').status_code, 400)
+        self.assertEqual(client.get('/?since=nonsense').status_code, 400)
+
+    def test_changes_added_and_removed(self):
+        course_dir = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220')
+        api.repo.git('mv', course_dir, course_dir.replace('cisc-220', 'cisc-221'))
+        course_file = os.path.join(self.local_repo, 'data', 'courses', 'cisc-221', 'course.yml')
+        with open(course_file) as f:
+            course = api.data.yaml.safe_load(f)
+        api.data.write_yaml(course_file, dict(course, number='221'))
+        api.repo.git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-qam', 'renumber')
+
+        client = Client(api.changes.Changes([api.data.Course]), BaseResponse)
+        data = json_resp(client.get('/?since=HEAD~1'))
+        self.assertEqual(data['changes']['courses'], {'added': ['CISC221'], 'modified': [], 'removed': ['CISC220']})
+
+    def test_changes_invalid_items(self):
+        course_file = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220', 'course.yml')
+        bad_dir = os.path.join(self.local_repo, 'data', 'courses', 'cisc-999')
+        os.mkdir(bad_dir)
+        with open(os.path.join(bad_dir, 'course.yml'), 'w') as f:
+            f.write('title: No subject\n')
+        with open(course_file, 'w') as f:
+            f.write('title: [oops')
+        api.repo.git('add', bad_dir, course_file)
+        api.repo.git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-qm', 'break')
+
+        client = Client(api.changes.Changes([api.data.Course]), BaseResponse)
+        data = json_resp(client.get('/?since=HEAD~1'))
+        self.assertEqual(data['changes']['courses'], {'added': [], 'modified': [], 'removed': ['CISC220']})
+        data = json_resp(client.get('/?since=HEAD&until=HEAD~1'))
+        self.assertEqual(data['changes']['courses'], {'added': ['CISC220'], 'modified': [], 'removed': []})
+
+
+class TestTimetable(TestCase):
+
+    @staticmethod
+    def section(course, kind, sid, *slots):
+        timeslots = [{'day_of_week': day, 'start_time': start, 'end_time': end}
+                     for day, start, end in slots]
+        return api.timetable.compile_section(course, {'type': kind, 'solus': {'id': sid},
+                                                      'timeslots': timeslots})
+
+    def test_parse_time(self):
+        self.assertEqual(api.timetable.parse_time('8:30'), 510)
+        self.assertEqual(api.timetable.parse_time('13:05'), 785)
+
+    def test_conflicts(self):
+        a = self.section('A', 'lecture', '1', (2, '12:30', '13:30'))
+        b = self.section('B', 'lecture', '2', (2, '13:00', '14:00'))
+        c = self.section('C', 'lecture', '3', (2, '13:30', '14:30'))
+        d = self.section('D', 'lecture', '4', (3, '12:30', '13:30'))
+        self.assertTrue(api.timetable.sections_conflict(a, b))
+        self.assertFalse(api.timetable.sections_conflict(a, c))  # back to back
+        self.assertFalse(api.timetable.sections_conflict(a, d))
+
+    def test_conflicting_terms(self):
+        fall = {'day_of_week': 2, 'start_time': '9:30', 'end_time': '10:30',
+                'term_start': '2013-09-09', 'term_end': '2013-10-20'}
+        late_fall = dict(fall, term_start='2013-10-21', term_end='2013-11-29')
+        a = api.timetable.compile_section('A', {'type': 'lab', 'timeslots': [fall]})
+        b = api.timetable.compile_section('B', {'type': 'lab', 'timeslots': [late_fall]})
+        self.assertFalse(api.timetable.sections_conflict(a, b))
+
+    def test_find_schedules(self):
+        groups = [
+            [self.section('A', 'lecture', 'a1', (1, '9:00', '10:00'))],
+            [self.section('A', 'lab', 'a2', (2, '9:00', '11:00')),
+             self.section('A', 'lab', 'a3', (3, '9:00', '11:00'))],
+            [self.section('B', 'lecture', 'b1', (2, '10:00', '11:00')),
+             self.section('B', 'lecture', 'b2', (1, '9:30', '10:30'))],
+        ]
+        found, complete = api.timetable.find_schedules(groups, 10, float('inf'))
+        self.assertTrue(complete)
+        self.assertEqual([[s.id for s in schedule] for schedule in found], [['a1', 'a3', 'b1']])
+
+        found, complete = api.timetable.find_schedules(groups[:2], 1, float('inf'))
+        self.assertFalse(complete)
+        self.assertEqual(len(found), 1)
+
+        found, complete = api.timetable.find_schedules(groups[:2], 2, float('inf'))
+        self.assertTrue(complete)  # exactly `limit` schedules isn't truncated
+        self.assertEqual(len(found), 2)
+
+
+class TestLRUCache(TestCase):
+
+    def test_eviction(self):
+        cache = api.cache.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        self.assertEqual(cache.get('a'), 1)  # b is now the least recently used
+        cache['c'] = 3
+        self.assertNotIn('b', cache)
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(len(cache), 2)
+
+
+class TestOccupancy(TestCase):
+
+    def booking(self, start, end):
+        return api.occupancy.Booking(day=1, start=start, end=end, course=None, term=None, details=None)
+
+    def test_day_intervals_at(self):
+        long_one = self.booking(0, 600)
+        short = [self.booking(m, m + 50) for m in range(480, 1200, 60)]
+        day = api.occupancy.DayIntervals(short + [long_one])
+        self.assertEqual(day.at(500), [long_one, short[0]])
+        self.assertEqual(day.at(530), [long_one])
+        self.assertEqual(day.at(700), [short[3]])
+        self.assertEqual(day.at(1300), [])
+
+    def test_all_day_booking(self):
+        all_day = self.booking(0, 24 * 60)
+        short = [self.booking(m, m + 50) for m in range(480, 1200, 60)]
+        day = api.occupancy.DayIntervals([all_day] + short)
+        self.assertEqual(day.at(700), [all_day, short[3]])
+        self.assertEqual(day.at(1439), [all_day])
+        self.assertEqual(day.at(1440), [])
+
+    def test_matches_brute_force(self):
+        import random
+        rand = random.Random(42)
+        bookings = []
+        for _ in range(200):
+            start = rand.randrange(0, 1440)
+            bookings.append(self.booking(start, start + rand.choice([0, 10, 50, 90, 180, 1440 - start])))
+        day = api.occupancy.DayIntervals(bookings)
+        for minute in range(0, 1441, 7):
+            expected = sorted((b for b in bookings if b.start <= minute < b.end), key=lambda b: (b.start, b.end))
+            self.assertEqual(day.at(minute), expected)
+
+    def test_skips_bad_timeslots(self):
+        class FakeCourse(object):
+            def get_terms(self, keys):
+                good = {'day_of_week': 2, 'start_time': '12:30', 'end_time': '13:20', 'location': 'Dunning'}
+                return [{'sections': [{'type': 'LEC', 'timeslots': [
+                    good, dict(good, start_time='TBA'), {'location': 'Dunning'}, 'oops']}]}]
+        rooms, _ = api.occupancy.build_index({'CISC220': FakeCourse()}, 'fall-2013')
+        self.assertEqual(len(rooms['Dunning'][2].bookings), 1)
+
+
+class TestOccupancyResources(TestCase):
+    local_repo = TestResource.local_repo
+
+    @classmethod
+    def setUpClass(cls):
+        with tarfile.open('{}.tar'.format(cls.local_repo)) as t:
+            t.extractall()
+
+    def setUp(self):
+        api.config.update(DATA_LOCAL=self.local_repo)
+        self.courses = api.data.Resource(provider_class=api.data.Course)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.local_repo)
+
+    def test_rooms(self):
+        client = Client(api.occupancy.Rooms(api.occupancy.Occupancy(self.courses)), BaseResponse)
+        self.assertEqual(json_resp(client.get('/')), ['Goodwin RM248', 'Humphrey Aud'])
+
+        bookings = json_resp(client.get('/Humphrey%20Aud/?day=2&time=12:30'))
+        self.assertEqual([(b['course'], b['section'], b['start_time']) for b in bookings],
+                         [('CISC220', '2427', '12:30')])
+        self.assertEqual(json_resp(client.get('/Humphrey%20Aud/?day=2&time=13:30')), [])
+        self.assertEqual(len(json_resp(client.get('/Humphrey%20Aud/'))), 2)
+        self.assertEqual(len(json_resp(client.get('/Humphrey%20Aud/?term=fall-2013'))), 2)
+        self.assertEqual(client.get('/Humphrey%20Aud/?term=winter-2014').status_code, 404)
+        self.assertEqual(client.get('/Humphrey%20Aud/?time=noon').status_code, 400)
+        self.assertEqual(client.get('/Humphrey%20Aud/?at=12:30').status_code, 400)
+        self.assertEqual(client.get('/Nowhere/').status_code, 404)
+
+    def test_old_terms_stay_unparsed(self):
+        course_dir = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220')
+        old_term = os.path.join(course_dir, 'term-winter-2013.yml')
+        with open(os.path.join(course_dir, 'term-fall-2013.yml')) as f:
+            term = api.data.yaml.safe_load(f)
+        term['season'] = 'winter'
+        term['sections'][0]['timeslots'][0]['location'] = 'Old Room'
+        api.data.write_yaml(old_term, term)
+        self.addCleanup(os.remove, old_term)
+        api.data.term_cache.clear()
+
+        courses = api.data.Resource(provider_class=api.data.Course)
+        client = Client(api.occupancy.Rooms(api.occupancy.Occupancy(courses)), BaseResponse)
+        self.assertEqual(json_resp(client.get('/')), ['Goodwin RM248', 'Humphrey Aud'])
+        self.assertNotIn('winter-2013', [key[2] for key in api.data.term_cache.keys()])
+        self.assertEqual(len(api.data.term_cache), 1)
+        self.assertIn('Old Room', json_resp(client.get('/?term=winter-2013')))
+        self.assertEqual(len(json_resp(client.get('/?term=all'))), 3)
+
+        self.addCleanup(api.config.update, TERM_CACHE_SIZE=api.config['TERM_CACHE_SIZE'])
+        api.config.update(TERM_CACHE_SIZE='1')
+        schedules = api.timetable.Schedules(courses)
+        for term in ('winter-2013', 'fall-2013'):
+            Client(schedules, BaseResponse).get('/?courses=CISC220&term={}'.format(term))
+        self.assertEqual(schedules._groups.keys(), [('CISC220', 'fall-2013')])
+
+    def test_instructor_schedule(self):
+        instructors = api.occupancy.InstructorResource(api.occupancy.Occupancy(self.courses))
+        client = Client(instructors, BaseResponse)
+        bookings = json_resp(client.get('/lamb-margaret/schedule/'))
+        self.assertEqual([b['day_of_week'] for b in bookings], [2, 4])
+        bookings = json_resp(client.get('/lamb-margaret/schedule/?day=4&time=12:00'))
+        self.assertEqual([b['location'] for b in bookings], ['Humphrey Aud'])
+        self.assertEqual(client.get('/lamb-margaret/schedule/?at=HEAD').status_code, 400)
+
+
+class TestExport(TestCase):
+    local_repo = TestResource.local_repo
+
+    def setUp(self):
+        with tarfile.open('{}.tar'.format(self.local_repo)) as t:
+            t.extractall()
+        api.config.update(DATA_LOCAL=self.local_repo)
+        self.out_dir = tempfile.mkdtemp()
+        courses = api.data.Resource(provider_class=api.data.Course)
+        self.appmap = {
+            '/courses': courses,
+            '/subjects': api.data.Resource(provider_class=api.data.Subject),  # no data, so skipped
+            '/schedules': api.timetable.Schedules(courses),
+        }
+        self.app = api.middleware.PrettyJSON(api.DispatcherMiddleware(api.root_app, self.appmap))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+        shutil.rmtree(self.local_repo)
+
+    def export(self):
+        return api.export.export_static(self.app, self.appmap, self.out_dir, threads=2)
+
+    def test_export(self):
+        self.assertEqual(self.export(), (3, 0))
+        client = Client(self.app, BaseResponse)
+        for url, filename in [('/', 'index.json'),
+                              ('/courses/', 'courses/index.json'),
+                              ('/courses/CISC220/', 'courses/CISC220/index.json')]:
+            path = os.path.join(self.out_dir, filename)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), client.get(url).get_data())
+            with gzip.open('{}.gz'.format(path)) as f:
+                self.assertEqual(f.read(), client.get(url).get_data())
+
+        with open(os.path.join(self.out_dir, 'manifest.json')) as f:
+            files = json.load(f)['files']
+        self.assertEqual(sorted(files), ['/', '/courses/', '/courses/CISC220/'])
+
+    def test_export_skips_unchanged(self):
+        self.export()
+        self.assertEqual(self.export(), (0, 3))
+
+        course_file = os.path.join(self.local_repo, 'data', 'courses', 'cisc-220', 'course.yml')
+        os.utime(course_file, (0, 0))
+        self.assertEqual(self.export(), (2, 1))  # the course and the course list
+
+        os.remove(os.path.join(self.out_dir, 'index.json.gz'))
+        self.assertEqual(self.export(), (1, 2))
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, 'index.json.gz')))